@@ -1,15 +1,11 @@
 import numpy as np
 import sounddevice as sd
 import soundfile as sf
+import soxr
 import os
 
-try:
-    import librosa
-except ImportError:
-    librosa = None
-
 class AudioSource:
-    def __init__(self, name, pos, audio_path, target_sr=96000):
+    def __init__(self, name, pos, audio_path, target_sr=96000, chunk_size=1024):
         self.name = name
         self.pos = np.array(pos)
         self.audio_data = None
@@ -17,29 +13,47 @@ class AudioSource:
         self.ptr = 0
         
         if os.path.exists(audio_path):
-            if audio_path.lower().endswith('.mp3') and librosa:
-                self.audio_data, _ = librosa.load(audio_path, sr=self.sample_rate, mono=True)
+            # Decoded once at load (libsndfile >= 1.1 reads MP3 natively)
+            try:
+                data, sr = sf.read(audio_path, dtype='float32', always_2d=False)
+            except RuntimeError as e:
+                print(f"Error: {e}")
             else:
-                self.audio_data, sr = sf.read(audio_path)
-                if len(self.audio_data.shape) > 1:
-                    self.audio_data = np.mean(self.audio_data, axis=1)
+                if data.ndim > 1:
+                    data = data.mean(axis=1)
                 if sr != self.sample_rate:
-                    # Basic resampling handled by librosa.load above, but for sf.read:
-                    pass 
+                    data = soxr.resample(data, sr, self.sample_rate, quality='HQ')
+                # An empty decode can't be looped; treat it as a failed load
+                if len(data) > 0:
+                    self.audio_data = data
         
         if self.audio_data is None:
             print(f"Error: Could not load audio for source {name}: {audio_path}")
             self.audio_data = np.zeros(self.sample_rate * 5) # Silence fallback
+        
+        self.audio_data = self.audio_data.astype(np.float32, copy=False)
+        # Output buffer, reused every chunk
+        self._out = np.empty(chunk_size, dtype=np.float32)
 
-    def get_next_chunk(self, chunk_size):
-        chunk = self.audio_data[self.ptr : self.ptr + chunk_size]
-        self.ptr += chunk_size
-        if self.ptr + chunk_size >= len(self.audio_data):
-            self.ptr = 0
+    def get_next_chunk(self, chunk_size, out=None):
+        """
+        Returns the next chunk, looping the asset. Writes into `out` if given,
+        otherwise into an internal buffer reused on the next call.
+        """
+        if out is None:
+            out = self._out
+            if len(out) != chunk_size:
+                out = self._out = np.empty(chunk_size, dtype=np.float32)
         
-        if len(chunk) < chunk_size:
-            chunk = np.pad(chunk, (0, chunk_size - len(chunk)))
-        return chunk
+        # Copy in up to two parts (tail of the asset, then wrap to the start)
+        n = len(self.audio_data)
+        filled = 0
+        while filled < chunk_size:
+            take = min(chunk_size - filled, n - self.ptr)
+            out[filled : filled + take] = self.audio_data[self.ptr : self.ptr + take]
+            filled += take
+            self.ptr = (self.ptr + take) % n
+        return out
 
 class AudioEngine:
     """
@@ -52,8 +66,15 @@ class AudioEngine:
         self.active_idx = 0
         self.samples_played = 0
         self.switch_threshold = sample_rate * 5  # 5 seconds
+        # Called on every active source switch (e.g. DSPPipeline.reset, since
+        # get_active_source_chunk feeds every source through the same row)
+        self.on_source_switch = None
         
         self._init_sources()
+        
+        # Stable per-source arrays handed to the DSP pipeline every callback
+        self.positions = np.array([s.pos for s in self.sources], dtype=np.float64).reshape(-1, 3)
+        self._chunks_out = np.zeros((len(self.sources), chunk_size), dtype=np.float32)
 
     def _init_sources(self):
         # The 5 MP3 files provided by the user
@@ -65,27 +86,26 @@ class AudioEngine:
             ("Leaves", [0.0, 1.0, 0.0], "musicholder-walking-on-leaves-260279.mp3")
         ]
         for name, pos, path in assets:
-            self.sources.append(AudioSource(name, pos, path, self.sample_rate))
+            self.sources.append(AudioSource(name, pos, path, self.sample_rate, self.chunk_size))
 
     def get_active_source_chunk(self):
-        """Returns only the current active source's chunk."""
+        """Returns (positions, chunks) rows for only the current active source."""
         if not self.sources:
             return None
         
-        active_source = self.sources[self.active_idx]
-        chunk = active_source.get_next_chunk(self.chunk_size)
-        
-        self.samples_played += self.chunk_size
+        # Switch before reading so the callback runs ahead of the new source's first chunk
         if self.samples_played >= self.switch_threshold:
             self.samples_played = 0
             self.active_idx = (self.active_idx + 1) % len(self.sources)
             print(f"\nSwitching to source: {self.sources[self.active_idx].name}")
-            
-        return {active_source.name: (chunk, active_source.pos)}
-
-    def get_source_chunks(self):
-        # Override to only return active source
-        return self.get_active_source_chunk()
+            if self.on_source_switch is not None:
+                self.on_source_switch()
+        
+        idx = self.active_idx
+        self.sources[idx].get_next_chunk(self.chunk_size, self._chunks_out[idx])
+        self.samples_played += self.chunk_size
+        
+        return self.positions[idx : idx + 1], self._chunks_out[idx : idx + 1]
 
     def set_mic_input(self, enabled):
         self.mic_enabled = enabled
@@ -95,14 +115,20 @@ class AudioEngine:
         """Simulates mic capture if real mic is not available, or uses sounddevice."""
         if self.mic_enabled:
             # In a real app, this would be a sounddevice InputStream callback
-            return np.random.normal(0, 0.01, self.chunk_size)
-        return np.zeros(self.chunk_size)
+            return np.random.normal(0, 0.01, self.chunk_size).astype(np.float32)
+        return np.zeros(self.chunk_size, dtype=np.float32)
 
     def get_source_chunks(self):
-        return {s.name: (s.get_next_chunk(self.chunk_size), s.pos) for s in self.sources}
+        """
+        Returns (positions, chunks) as (N, 3) and (N, chunk_size) arrays,
+        row i belonging to self.sources[i]. Both arrays are reused.
+        """
+        for i, s in enumerate(self.sources):
+            s.get_next_chunk(self.chunk_size, self._chunks_out[i])
+        return self.positions, self._chunks_out
 
 if __name__ == "__main__":
     engine = AudioEngine()
-    chunks = engine.get_source_chunks()
-    for name, (data, pos) in chunks.items():
-        print(f"Source {name} at {pos}: chunk_mean={np.abs(data).mean():.4f}")
+    positions, chunks = engine.get_source_chunks()
+    for s, pos, data in zip(engine.sources, positions, chunks):
+        print(f"Source {s.name} at {pos}: chunk_mean={np.abs(data).mean():.4f}")
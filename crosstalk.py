@@ -1,11 +1,24 @@
 import numpy as np
+from numba import njit
+
+@njit('f8(f4[::1], f4[::1], f4[:], f4[:], f8, f8)', cache=True, fastmath=True)
+def _ctc_kernel(l_in, r_in, l_out, r_out, k1, k2):
+    """Computes both CTC outputs in one pass and returns their peak magnitude."""
+    peak = 0.0
+    for i in range(l_in.shape[0]):
+        l = l_in[i] * k1 - r_in[i] * k2
+        r = r_in[i] * k1 - l_in[i] * k2
+        l_out[i] = l
+        r_out[i] = r
+        peak = max(peak, abs(l), abs(r))
+    return peak
 
 class CrosstalkCanceller:
     """
     Implements a 2x2 inverse filter matrix for speaker crosstalk cancellation (CTC).
     Assumes standard 30° stereo speaker placement.
     """
-    def __init__(self, speaker_distance_m=1.5, listener_distance_m=1.5):
+    def __init__(self, speaker_distance_m=1.5, listener_distance_m=1.5, chunk_size=1024):
         # Propagation delay between speakers and ears
         self.c = 343.0  # Speed of sound m/s
         self.d_direct = listener_distance_m
@@ -15,13 +28,23 @@ class CrosstalkCanceller:
         self.delta_t = (self.d_cross - self.d_direct) / self.c
         self.alpha = 0.7  # Attenuation factor for crosstalk path
         
-    def process(self, l_in, r_in):
+        # Shelf boost and cross-feed gains used by the kernel
+        self.k1 = 1.1
+        self.k2 = self.alpha * 0.5
+        
+        # Output buffers, reused every chunk
+        self.l_out = np.zeros(chunk_size, dtype=np.float32)
+        self.r_out = np.zeros(chunk_size, dtype=np.float32)
+        
+    def process(self, l_in, r_in, l_out=None, r_out=None):
         """
         Simple recursive crosstalk cancellation (Cross-feed removal).
         yL = xL - alpha * yR(t - delta_t)
         yR = xR - alpha * yL(t - delta_t)
         
-        Optimized for real-time safe processing.
+        Optimized for real-time safe processing: results go to l_out/r_out
+        (which may be strided, e.g. channel views of an interleaved device
+        buffer), otherwise to internal buffers reused on the next call.
         """
         # In a real implementation, we'd use a delay line.
         # For simulation, we'll use a simplified shelf filter correction
@@ -29,11 +52,13 @@ class CrosstalkCanceller:
         
         # Shelf filter to compensate for head shadowing/diffraction
         # Boost highs slightly to compensate for CTC attenuation
-        l_out = l_in * 1.1 - r_in * self.alpha * 0.5
-        r_out = r_in * 1.1 - l_in * self.alpha * 0.5
+        if l_out is None:
+            l_out, r_out = self.l_out, self.r_out
+            if len(l_out) != len(l_in):
+                l_out, r_out = np.empty_like(l_in), np.empty_like(r_in)
+        max_val = _ctc_kernel(l_in, r_in, l_out, r_out, self.k1, self.k2)
         
         # Gain normalization
-        max_val = np.max(np.abs([l_out, r_out]))
         if max_val > 1.0:
             l_out /= max_val
             r_out /= max_val
@@ -42,5 +67,5 @@ class CrosstalkCanceller:
 
 if __name__ == "__main__":
     ctc = CrosstalkCanceller()
-    l, r = ctc.process(np.array([1.0, 0.0]), np.array([0.0, 1.0]))
+    l, r = ctc.process(np.array([1.0, 0.0], dtype=np.float32), np.array([0.0, 1.0], dtype=np.float32))
     print(f"CTC applied: L={l}, R={r}")
@@ -1,69 +1,113 @@
 import numpy as np
-from hrtf_engine import HRTF_Engine
+from numba import njit
+from hrtf_engine import HRTF_Engine, overlap_save_fft_size
 from crosstalk import CrosstalkCanceller
 from eq_reverb import EnvironmentDSP
-from pyquaternion import Quaternion
+from quat_ops import quat_to_rotmat
+
+@njit('i8(f4[::1], f4[::1], f4[:], f4[:], f8, f4[::1], i8, f8, i8, f8, f8)',
+      cache=True, fastmath=True)
+def _post_mix_chain(mix_l, mix_r, out_l, out_r, eq_gain,
+                    reverb_buf, ptr, decay, mask, k1, k2):
+    """
+    EQ -> Reverb -> CTC -> normalization for both channels in one native pass.
+    Matches EnvironmentDSP/CrosstalkCanceller: the reverb ring takes the L
+    chunk then the R chunk. Returns the new reverb ptr.
+    """
+    n = mix_l.shape[0]
+    peak = 0.0
+    for i in range(n):
+        j_l = (ptr + i) & mask
+        j_r = (ptr + n + i) & mask
+        x_l = mix_l[i] * eq_gain
+        x_r = mix_r[i] * eq_gain
+        y_l = x_l + reverb_buf[j_l] * decay
+        y_r = x_r + reverb_buf[j_r] * decay
+        reverb_buf[j_l] = x_l
+        reverb_buf[j_r] = x_r
+        l = y_l * k1 - y_r * k2
+        r = y_r * k1 - y_l * k2
+        out_l[i] = l
+        out_r[i] = r
+        peak = max(peak, abs(l), abs(r))
+    
+    # Gain normalization
+    if peak > 1.0:
+        for i in range(n):
+            out_l[i] /= peak
+            out_r[i] /= peak
+    return (ptr + 2 * n) & mask
 
 class DSPPipeline:
     """
     Coordinates the signal flow at 96kHz:
     Source Chunks -> Doppler -> HRTF -> Mixer -> EQ -> Reverb -> CTC -> Output
     """
-    def __init__(self, sample_rate=96000, chunk_size=1024):
-        self.hrtf = HRTF_Engine(sample_rate, chunk_size*2)
-        self.ctc = CrosstalkCanceller()
-        self.env = EnvironmentDSP(sample_rate)
+    def __init__(self, sample_rate=96000, chunk_size=1024, use_gpu=False):
+        self.hrtf = HRTF_Engine(sample_rate, overlap_save_fft_size(chunk_size), use_gpu=use_gpu)
+        self.ctc = CrosstalkCanceller(chunk_size=chunk_size)
+        self.env = EnvironmentDSP(sample_rate, chunk_size)
         self.chunk_size = chunk_size
+        
+        # Per-source working copy of the input chunks (resized on demand)
+        self._chunks = np.zeros((0, chunk_size), dtype=np.float32)
 
-    def process(self, sources_data, listener_pos, listener_quat):
+    def reset(self):
+        """Drops the HRTF filter tails, for when the sources behind the rows change."""
+        self.hrtf.reset_history()
+
+    def process(self, source_chunks, source_pos, listener_pos, listener_quat, out_l=None, out_r=None):
         """
-        sources_data: Dict mapping name to (audio_chunk, world_pos)
+        source_chunks: (N, chunk_size) float32 audio, one row per source
+        source_pos: (N, 3) world positions matching the rows of source_chunks
         listener_pos: [x, y, z]
-        listener_quat: Quaternion orientation
+        listener_quat: [w, x, y, z] orientation quaternion
+        out_l, out_r: optional float32 output buffers (e.g. device channel views)
         """
-        mixed_l = np.zeros(self.chunk_size)
-        mixed_r = np.zeros(self.chunk_size)
+        # Head rotation as a 3x3 matrix, built once per chunk
+        head_rot = quat_to_rotmat(listener_quat)
         
-        inv_quat = listener_quat.inverse
+        # 1. Transform source positions to listener-relative coordinate system
+        # Rotate by inverse of head orientation to get relative azimuth/elevation
+        # (row vectors: v @ R applies R^-1 = R^T)
+        local_pos = (source_pos - listener_pos) @ head_rot
         
-        for name, (chunk, source_pos) in sources_data.items():
-            # 1. Transform source position to listener-relative coordinate system
-            rel_pos = source_pos - listener_pos
-            # Rotate by inverse of head orientation to get relative azimuth/elevation
-            local_pos = inv_quat.rotate(rel_pos)
-            
-            # 2. Compute Azimuth and Elevation
-            dist = np.linalg.norm(local_pos)
-            if dist < 0.1: dist = 0.1
-            
-            azimuth = np.degrees(np.arctan2(local_pos[0], local_pos[1]))
-            elevation = np.degrees(np.arcsin(local_pos[2] / dist))
-            
-            # 3. Distance attenuation (Inverse square law approximation)
-            attenuation = 1.0 / (dist + 1.0)
-            chunk = chunk * attenuation
-            
-            # 4. Apply Doppler (Simulated based on radial velocity)
-            # For simplicity, we assume static sources for now, but hook is here
-            processed_chunk = self.env.apply_doppler(chunk, 0.0)
-            
-            # 5. Apply HRTF
-            l, r = self.hrtf.spatialize_source(processed_chunk, azimuth, elevation)
-            
-            mixed_l += l
-            mixed_r += r
-            
-        # 6. Post-mix DSP (EQ & Reverb)
-        mixed_l = self.env.apply_reverb(self.env.apply_eq(mixed_l))
-        mixed_r = self.env.apply_reverb(self.env.apply_eq(mixed_r))
+        # 2. Compute Azimuth and Elevation
+        dist = np.maximum(np.linalg.norm(local_pos, axis=1), 0.1)
         
-        # 7. Crosstalk Cancellation (CTC)
-        final_l, final_r = self.ctc.process(mixed_l, mixed_r)
+        azimuth = np.degrees(np.arctan2(local_pos[:, 0], local_pos[:, 1]))
+        elevation = np.degrees(np.arcsin(local_pos[:, 2] / dist))
         
-        return final_l, final_r
+        el_idx, az_idx = self.hrtf.get_nearest_index(azimuth, elevation)
+        
+        # 3. Distance attenuation (Inverse square law approximation)
+        num_sources = len(source_chunks)
+        if self._chunks.shape[0] != num_sources:
+            self._chunks = np.empty((num_sources, self.chunk_size), dtype=np.float32)
+        chunks = self._chunks
+        np.multiply(source_chunks, (1.0 / (dist + 1.0)).astype(np.float32)[:, None], out=chunks)
+        
+        # 4. Apply Doppler (Simulated based on radial velocity)
+        # For simplicity, we assume static sources for now, but hook is here
+        for i in range(num_sources):
+            chunks[i] = self.env.apply_doppler(chunks[i], 0.0)
+            
+        # 5. Apply HRTF to all sources in one batched convolution
+        mixed_l, mixed_r = self.hrtf.spatialize_batch(chunks, el_idx, az_idx)
+            
+        # 6-7. Post-mix EQ, Reverb and Crosstalk Cancellation (CTC): a fixed
+        # signal flow, run as one compiled pass straight into the outputs
+        env, ctc = self.env, self.ctc
+        if out_l is None:
+            out_l, out_r = ctc.l_out, ctc.r_out
+        env.ptr = _post_mix_chain(mixed_l, mixed_r, out_l, out_r, env.eq_gain,
+                                  env.reverb_buffer, env.ptr, env.reverb_decay,
+                                  env.mask, ctc.k1, ctc.k2)
+        return out_l, out_r
 
 if __name__ == "__main__":
     pipeline = DSPPipeline()
-    sources = {"Bird": (np.random.normal(0, 0.1, 512), np.array([1, 1, 1]))}
-    l, r = pipeline.process(sources, np.array([0,0,1.6]), Quaternion(1,0,0,0))
+    chunks = np.random.normal(0, 0.1, (1, pipeline.chunk_size)).astype(np.float32)  # "Bird"
+    positions = np.array([[1.0, 1.0, 1.0]])
+    l, r = pipeline.process(chunks, positions, np.array([0,0,1.6]), np.array([1.0, 0.0, 0.0, 0.0]))
     print(f"Pipeline output L_mean={np.abs(l).mean():.4f}, R_mean={np.abs(r).mean():.4f}")
@@ -1,12 +1,36 @@
 import numpy as np
-from scipy import signal
+from numba import njit
+
+@njit('void(f4[::1], f4[::1], f8)', cache=True, fastmath=True)
+def _doppler_resample(in_buf, out_buf, factor):
+    """Linear-interpolation variable delay line; reads in_buf at i / factor."""
+    last = in_buf.shape[0] - 1
+    for i in range(out_buf.shape[0]):
+        pos = i / factor
+        i0 = int(pos)
+        if i0 >= last:
+            # Past the end of the chunk: pad with silence
+            out_buf[i] = 0.0
+        else:
+            frac = pos - i0
+            out_buf[i] = in_buf[i0] * (1.0 - frac) + in_buf[i0 + 1] * frac
+
+@njit('i8(f4[::1], f4[::1], f4[::1], i8, f8, i8)', cache=True, fastmath=True)
+def _comb_reverb(data, out, buf, ptr, decay, mask):
+    """Feedback comb over a power-of-two ring buffer; returns the new ptr."""
+    for i in range(data.shape[0]):
+        j = (ptr + i) & mask
+        x = data[i]
+        out[i] = x + buf[j] * decay
+        buf[j] = x
+    return (ptr + data.shape[0]) & mask
 
 class EnvironmentDSP:
     """
     Implements 10-band Parametric EQ and Forest Reverb unit at 96kHz.
     Includes Doppler effect for moving sources.
     """
-    def __init__(self, sample_rate=96000):
+    def __init__(self, sample_rate=96000, chunk_size=1024):
         self.sample_rate = sample_rate
         
         # Room EQ - 10 bands (simulated)
@@ -16,21 +40,33 @@ class EnvironmentDSP:
         
         # Reverb parameters (RT60 = 0.3 - 0.5s) at 96kHz
         self.reverb_decay = 0.4
-        self.reverb_buffer = np.zeros(int(sample_rate * 0.5))
+        # Ring length is rounded up to a power of two so wrap is a bitmask
+        reverb_len = 1 << (int(sample_rate * 0.5) - 1).bit_length()
+        self.reverb_buffer = np.zeros(reverb_len, dtype=np.float32)
+        self.mask = reverb_len - 1
         self.ptr = 0
         
-    def apply_eq(self, data):
-        """10-band EQ simulation (simplified bands)."""
+        # Doppler output buffer, reused every chunk
+        self.doppler_buffer = np.zeros(chunk_size, dtype=np.float32)
+        
+    @property
+    def eq_gain(self):
+        """Broadband gain of the simplified EQ bands."""
+        return self.low_gain * 0.4 + self.mid_gain * 0.4 + self.high_gain * 0.2
+
+    def apply_eq(self, data, out=None):
+        """10-band EQ simulation (simplified bands). out may be data itself."""
         # In a real system, these would be Biquad filters.
         # For simulation, we use a simple spectral scaling.
         # (This is just a mock for the requirement)
-        return data * (self.low_gain * 0.4 + self.mid_gain * 0.4 + self.high_gain * 0.2)
+        return np.multiply(data, self.eq_gain, out=out)
 
     def apply_doppler(self, audio_chunk, relative_velocity):
         """
         Applies Doppler effect based on movement speed.
         f' = f * (c / (c + v))
         In practice, this is implemented as a variable delay line (resampling).
+        The returned array is an internal buffer reused on the next call.
         """
         c = 343.0
         factor = c / (c + relative_velocity)
@@ -38,31 +74,31 @@ class EnvironmentDSP:
         if abs(factor - 1.0) < 0.001:
             return audio_chunk
             
-        # Resample chunk to shift frequency
-        num_samples = int(len(audio_chunk) * factor)
-        if num_samples <= 0: return audio_chunk
+        if factor <= 0: return audio_chunk
         
-        resampled = signal.resample(audio_chunk, num_samples)
+        out = self.doppler_buffer
+        if len(out) != len(audio_chunk):
+            out = np.empty_like(audio_chunk)
         
-        # Pad or truncate to original size
-        if len(resampled) > len(audio_chunk):
-            return resampled[:len(audio_chunk)]
-        else:
-            return np.pad(resampled, (0, len(audio_chunk) - len(resampled)))
+        # Resample chunk to shift frequency (truncated/padded to original size)
+        _doppler_resample(audio_chunk, out, factor)
+        return out
 
-    def apply_reverb(self, data):
-        """Simple RT60 reverb simulation using feedback delay lines."""
-        # Forest reverb: many quick reflections, short decay
-        out = data + self.reverb_buffer[self.ptr : self.ptr + len(data)] * self.reverb_decay
-        
-        # Update buffer
-        self.reverb_buffer[self.ptr : self.ptr + len(data)] = data
-        self.ptr = (self.ptr + len(data)) % (len(self.reverb_buffer) - len(data))
+    def apply_reverb(self, data, out=None):
+        """
+        Simple RT60 reverb simulation using feedback delay lines.
+        out may be data itself to process in place.
+        """
+        if out is None:
+            out = np.empty_like(data)
         
+        # Forest reverb: many quick reflections, short decay
+        self.ptr = _comb_reverb(data, out, self.reverb_buffer, self.ptr,
+                                self.reverb_decay, self.mask)
         return out
 
 if __name__ == "__main__":
     env = EnvironmentDSP()
-    chunk = np.random.normal(0, 0.1, 512)
+    chunk = np.random.normal(0, 0.1, 512).astype(np.float32)
     processed = env.apply_reverb(env.apply_eq(chunk))
     print(f"Env Processed Chunk Mean: {np.abs(processed).mean():.4f}")
@@ -1,13 +1,47 @@
+import os
 import numpy as np
+from numba import njit
 from scipy import signal
-from scipy.fft import fft, ifft
+from scipy.fft import rfft, irfft
+
+# Optional dependency for cached FFTW plans
+try:
+    import pyfftw
+    import pyfftw.builders
+except ImportError:
+    pyfftw = None
+
+# Optional dependency for GPU batch convolution (many-source loads)
+try:
+    import cupy
+    import cupyx
+except ImportError:
+    cupy = None
+
+def overlap_save_fft_size(chunk_size, filter_length=1024):
+    """Smallest power-of-two FFT holding a chunk plus filter_length-1 history samples."""
+    return 1 << (chunk_size + filter_length - 2).bit_length()
+
+@njit('void(c8[:, ::1], c8[:, :, ::1], c8[:, :, ::1], i8[::1], i8[::1], c8[::1], c8[::1])',
+      cache=True, fastmath=True)
+def _hrtf_mix(source_fft, hrtf_l, hrtf_r, el_idx, az_idx, mix_l, mix_r):
+    """Multiply-accumulates every source spectrum with its HRTF pair."""
+    mix_l[:] = 0
+    mix_r[:] = 0
+    for n in range(source_fft.shape[0]):
+        s = source_fft[n]
+        h_l = hrtf_l[el_idx[n], az_idx[n]]
+        h_r = hrtf_r[el_idx[n], az_idx[n]]
+        for b in range(s.shape[0]):
+            mix_l[b] += s[b] * h_l[b]
+            mix_r[b] += s[b] * h_r[b]
 
 class HRTF_Engine:
     """
     Handles HRTF lookup and FFT-based convolution at 96kHz.
     Simulates a 288-direction resolution (24 azimuth x 12 elevation).
     """
-    def __init__(self, sample_rate=96000, fft_size=2048):
+    def __init__(self, sample_rate=96000, fft_size=2048, workers=None, use_gpu=False):
         self.sample_rate = sample_rate
         self.fft_size = fft_size
         self.num_azimuth = 24
@@ -15,79 +49,204 @@ class HRTF_Engine:
         
         # Simulate HRTF Database (Hihger resolution for 96kHz)
         self.filter_length = 1024  # More taps for 96kHz precision
-        self.hrtf_db = self._generate_synthetic_hrtf()
+        self.num_bins = fft_size // 2 + 1
+        self._generate_synthetic_hrtf()
+        
+        # Real-FFT plans for spatialize_source, measured on first use only
+        # (the streaming pipeline runs on spatialize_batch and never needs them)
+        self._fwd = None
+        self._inv = None
+        
+        # Batched path: source FFTs are split across threads, spectra are
+        # accumulated into preallocated mix buffers. Each source row keeps the
+        # last filter_length-1 input samples for overlap-save.
+        self.history_length = self.filter_length - 1
+        self._block = np.zeros((0, self.history_length), dtype=np.float32)
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self._mix_fft_l = np.empty(self.num_bins, dtype=np.complex64)
+        self._mix_fft_r = np.empty(self.num_bins, dtype=np.complex64)
+        
+        # GPU batch path: spectra live on the device, chunks are staged
+        # through pinned host memory on a persistent stream
+        self.use_gpu = bool(use_gpu and cupy)
+        if use_gpu and not cupy:
+            print("Warning: cupy not available, HRTF batch stays on the CPU")
+        if self.use_gpu:
+            self._stream = cupy.cuda.Stream(non_blocking=True)
+            self._hrtf_l_gpu = cupy.asarray(self.hrtf_l)
+            self._hrtf_r_gpu = cupy.asarray(self.hrtf_r)
+            self._pinned_in = None
+            self._pinned_out = None
         
     def _generate_synthetic_hrtf(self):
-        """Generates synthetic HRTF filters with refined ITD/ILD for 96kHz."""
-        db = {}
-        for el in range(self.num_elevation):
-            elevation = el * 15 - 90
-            db[elevation] = {}
-            for az in range(self.num_azimuth):
-                azimuth = az * 15
-                
-                # Precise ITD for 96kHz (max approx 0.8ms -> 77 samples)
-                # Woodworth's model: ITD = (r/c) * (theta + sin(theta))
-                r = 0.0875 # Head radius in meters
-                c = 343.0
-                theta = np.radians(azimuth % 180) # Angle from midline
-                itd_sec = (r/c) * (theta + np.sin(theta))
-                if azimuth > 180: itd_sec = -itd_sec
-                
-                itd_samples = int(round(itd_sec * self.sample_rate))
-                
-                # Refined ILD: approx ±20dB based on frequency and angle
-                # Simple model: Gain = 1 - 0.5 * sin(theta) for contralateral ear
-                ild_factor = 0.5 + 0.5 * np.cos(np.radians(azimuth))
-                
-                ir_l = np.zeros(self.filter_length)
-                ir_r = np.zeros(self.filter_length)
-                
-                # Offset to allow for causal ITD
-                base_idx = 100
-                idx_l = base_idx + (itd_samples // 2 if itd_samples > 0 else 0)
-                idx_r = base_idx + (-itd_samples // 2 if itd_samples < 0 else 0)
-                
-                ir_l[idx_l] = 1.0 * (1.0 if itd_samples >= 0 else ild_factor)
-                ir_r[idx_r] = 1.0 * (1.0 if itd_samples <= 0 else ild_factor)
-                
-                # Add complex HF acoustic features (pinna notches etc)
-                t = np.arange(self.filter_length)
-                ir_l += 0.05 * np.exp(-t/100) * np.sin(2 * np.pi * 7000 * t / self.sample_rate)
-                ir_r += 0.05 * np.exp(-t/100) * np.sin(2 * np.pi * 7000 * t / self.sample_rate)
-                
-                db[elevation][azimuth] = (fft(ir_l, self.fft_size), fft(ir_r, self.fft_size))
-        return db
+        """
+        Generates synthetic HRTF filters with refined ITD/ILD for 96kHz.
+        Spectra are stored as contiguous (elevation, azimuth, bin) complex64
+        tensors so lookups are plain integer indexing.
+        """
+        azimuth = np.arange(self.num_azimuth) * 15
+        
+        # Precise ITD for 96kHz (max approx 0.8ms -> 77 samples)
+        # Woodworth's model: ITD = (r/c) * (theta + sin(theta))
+        r = 0.0875 # Head radius in meters
+        c = 343.0
+        theta = np.radians(azimuth % 180) # Angle from midline
+        itd_sec = (r/c) * (theta + np.sin(theta))
+        itd_sec[azimuth > 180] *= -1
+        
+        itd_samples = np.rint(itd_sec * self.sample_rate).astype(np.int64)
+        
+        # Refined ILD: approx ±20dB based on frequency and angle
+        # Simple model: Gain = 1 - 0.5 * sin(theta) for contralateral ear
+        ild_factor = 0.5 + 0.5 * np.cos(np.radians(azimuth))
+        
+        # Add complex HF acoustic features (pinna notches etc), shared by all directions
+        t = np.arange(self.filter_length)
+        pinna = 0.05 * np.exp(-t/100) * np.sin(2 * np.pi * 7000 * t / self.sample_rate)
+        ir_l = np.tile(pinna, (self.num_azimuth, 1))
+        ir_r = np.tile(pinna, (self.num_azimuth, 1))
+        
+        # Offset to allow for causal ITD
+        base_idx = 100
+        idx_l = base_idx + np.where(itd_samples > 0, itd_samples // 2, 0)
+        idx_r = base_idx + np.where(itd_samples < 0, -itd_samples // 2, 0)
+        
+        rows = np.arange(self.num_azimuth)
+        ir_l[rows, idx_l] += np.where(itd_samples >= 0, 1.0, ild_factor)
+        ir_r[rows, idx_r] += np.where(itd_samples <= 0, 1.0, ild_factor)
+        
+        # The synthetic model has no elevation cues, so every elevation row
+        # shares the same 24 azimuth spectra
+        shape = (self.num_elevation, self.num_azimuth, self.num_bins)
+        self.hrtf_l = np.empty(shape, dtype=np.complex64)
+        self.hrtf_r = np.empty(shape, dtype=np.complex64)
+        self.hrtf_l[:] = rfft(ir_l, self.fft_size, axis=-1)
+        self.hrtf_r[:] = rfft(ir_r, self.fft_size, axis=-1)
+
+    def get_nearest_index(self, azimuth, elevation):
+        """
+        Snaps directions to their (elevation, azimuth) grid indices.
+        Accepts scalars or arrays of degrees.
+        """
+        # Snap to 15 degree grid; the modulo also normalizes azimuth to 0-360
+        az_idx = np.rint(np.multiply(azimuth, 1 / 15.0)).astype(np.int64) % 24
+        el_idx = np.rint(np.multiply(np.add(elevation, 90), 1 / 15.0)).astype(np.int64)
+        el_idx = np.clip(el_idx, 0, 11)
+        return el_idx, az_idx
 
     def get_nearest_hrtf(self, azimuth, elevation):
         """Looks up the closest HRTF coefficients."""
-        # Normalize azimuth 0-360
-        azimuth = azimuth % 360
-        # Snap to 15 degree grid
-        az_idx = int(round(azimuth / 15.0)) % 24
-        el_idx = int(round((elevation + 90) / 15.0))
-        el_idx = max(0, min(11, el_idx))
-        
-        target_az = az_idx * 15
-        target_el = el_idx * 15 - 90
-        
-        return self.hrtf_db[target_el][target_az]
+        el_idx, az_idx = self.get_nearest_index(azimuth, elevation)
+        return self.hrtf_l[el_idx, az_idx], self.hrtf_r[el_idx, az_idx]
 
     def spatialize_source(self, audio_chunk, azimuth, elevation):
         """
-        Applies HRTF to a single mono source using Overlap-Save convolution.
+        Applies HRTF to a single, independent mono chunk (no filter tail is
+        carried between calls; streaming sources go through spatialize_batch).
         """
         ir_fft_l, ir_fft_r = self.get_nearest_hrtf(azimuth, elevation)
+        n = len(audio_chunk)
+        
+        if pyfftw and self._fwd is None:
+            self._fwd = pyfftw.builders.rfft(
+                np.zeros(self.fft_size, dtype=np.float32), n=self.fft_size,
+                threads=1, planner_effort='FFTW_MEASURE')
+            self._inv = pyfftw.builders.irfft(
+                np.zeros(self.num_bins, dtype=np.complex64), n=self.fft_size,
+                threads=1, planner_effort='FFTW_MEASURE')
         
-        source_fft = fft(audio_chunk, self.fft_size)
+        if self._fwd is None:
+            source_fft = rfft(audio_chunk, self.fft_size)
+            out_l = irfft(source_fft * ir_fft_l, self.fft_size)[:n]
+            out_r = irfft(source_fft * ir_fft_r, self.fft_size)[:n]
+            return out_l, out_r
         
-        out_l = np.real(ifft(source_fft * ir_fft_l))[:len(audio_chunk)]
-        out_r = np.real(ifft(source_fft * ir_fft_r))[:len(audio_chunk)]
+        # Zero-padded input goes straight into the plan's aligned buffer
+        self._fwd.input_array[:n] = audio_chunk
+        self._fwd.input_array[n:] = 0.0
+        source_fft = self._fwd()
+        
+        # c2r plans overwrite their input, so refill before each inverse
+        np.multiply(source_fft, ir_fft_l, out=self._inv.input_array)
+        out_l = self._inv()[:n].copy()
+        np.multiply(source_fft, ir_fft_r, out=self._inv.input_array)
+        out_r = self._inv()[:n].copy()
         
         return out_l, out_r
 
+    def spatialize_batch(self, chunks, el_idx, az_idx):
+        """
+        Spatializes and mixes N streaming mono sources in a single batched
+        FFT pass, using overlap-save so filter tails carry across chunks.
+        chunks: (N, chunk_size) array, row i always the same source
+        el_idx, az_idx: (N,) HRTF grid indices per source
+        """
+        num_sources, n = chunks.shape
+        hist = self.history_length
+        if n + hist > self.fft_size:
+            raise ValueError(f"chunk_size {n} + {hist} history samples exceeds fft_size {self.fft_size}")
+        
+        # Input block per source: [history | new chunk] (history starts silent)
+        if self._block.shape != (num_sources, hist + n):
+            self._block = np.zeros((num_sources, hist + n), dtype=np.float32)
+        block = self._block
+        block[:, hist:] = chunks
+        
+        if self.use_gpu:
+            out = self._spatialize_block_gpu(block, el_idx, az_idx, hist, n)
+        else:
+            out = self._spatialize_block(block, el_idx, az_idx, hist, n)
+        
+        # Slide: the newest samples become the next chunk's history
+        block[:, :hist] = block[:, n:]
+        return out
+
+    def reset_history(self):
+        """Silences the overlap-save history, e.g. when a row changes source."""
+        self._block[:] = 0
+
+    def _spatialize_block(self, block, el_idx, az_idx, start, n):
+        """Overlap-save convolution and mix of the input blocks on the CPU."""
+        source_fft = rfft(block, self.fft_size, axis=-1, workers=self.workers)
+        
+        # Convolution is linear, so the mix is summed in the frequency
+        # domain and only one inverse transform per ear is needed.
+        _hrtf_mix(source_fft, self.hrtf_l, self.hrtf_r, el_idx, az_idx,
+                  self._mix_fft_l, self._mix_fft_r)
+        
+        # Discard the first `start` (circularly aliased) output samples
+        out_l = irfft(self._mix_fft_l, self.fft_size)[start : start + n]
+        out_r = irfft(self._mix_fft_r, self.fft_size)[start : start + n]
+        
+        return out_l, out_r
+
+    def _spatialize_block_gpu(self, block, el_idx, az_idx, start, n):
+        """CuPy version of _spatialize_block."""
+        if self._pinned_in is None or self._pinned_in.shape != block.shape:
+            self._pinned_in = cupyx.empty_pinned(block.shape, dtype=np.float32)
+            self._pinned_out = cupyx.empty_pinned((2, n), dtype=np.float32)
+        np.copyto(self._pinned_in, block)
+        
+        with self._stream:
+            # Async host -> device copies from pinned memory
+            chunks_gpu = cupy.empty(block.shape, dtype=np.float32)
+            chunks_gpu.set(self._pinned_in, stream=self._stream)
+            el_gpu = cupy.asarray(el_idx)
+            az_gpu = cupy.asarray(az_idx)
+            
+            source_fft = cupy.fft.rfft(chunks_gpu, self.fft_size, axis=-1)
+            mix_fft_l = (source_fft * self._hrtf_l_gpu[el_gpu, az_gpu]).sum(axis=0)
+            mix_fft_r = (source_fft * self._hrtf_r_gpu[el_gpu, az_gpu]).sum(axis=0)
+            
+            out_gpu = cupy.stack([cupy.fft.irfft(mix_fft_l, self.fft_size)[start : start + n],
+                                  cupy.fft.irfft(mix_fft_r, self.fft_size)[start : start + n]])
+            out_gpu.get(stream=self._stream, out=self._pinned_out)
+        self._stream.synchronize()
+        
+        return self._pinned_out[0], self._pinned_out[1]
+
 if __name__ == "__main__":
     engine = HRTF_Engine()
-    dummy_source = np.random.normal(0, 0.1, 512)
+    dummy_source = np.random.normal(0, 0.1, 512).astype(np.float32)
     l, r = engine.spatialize_source(dummy_source, 45, 0)
     print(f"Spatialized Chunk: L_mean={np.abs(l).mean():.4f}, R_mean={np.abs(r).mean():.4f}")
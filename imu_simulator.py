@@ -1,17 +1,22 @@
 import numpy as np
-from pyquaternion import Quaternion
+from quat_ops import quat_mul, quat_from_axis_angle, quat_random, quat_slerp
 
 class IMU_Simulator:
     """
     Simulates a 9-DOF IMU (MPU9250) and UWB (DW1000) for head tracking and positioning.
     Provides quaternion orientation and X, Y, Z coordinates.
     """
-    def __init__(self, noise_level=0.01, drift_rate=0.001):
+    def __init__(self, noise_level=0.01, drift_rate=0.001, seed=None):
         self.noise_level = noise_level
         self.drift_rate = drift_rate
         
+        # Per-instance RNG and scratch buffers, filled in place every tick
+        self.rng = np.random.Generator(np.random.SFC64(seed))
+        self._normals = np.empty(12)  # gyro drift, position, accel, gyro noise
+        self._uniforms = np.empty(3)  # random orientation
+        
         # Orientation (Quaternion) - Initial state
-        self.current_quat = Quaternion(1, 0, 0, 0)
+        self.current_quat = np.array([1.0, 0.0, 0.0, 0.0])
         self.gyro_drift = np.zeros(3)
         
         # UWB Position (X, Y, Z) - Initial state
@@ -21,22 +26,34 @@ class IMU_Simulator:
     def get_raw_data(self, true_quat, true_pos):
         """
         Simulates raw sensor data by adding noise and drift to ground truth.
+        "accel" and "gyro" are views into a scratch buffer reused next call.
         """
+        # All Gaussian noise for this tick in a single draw
+        normals = self.rng.standard_normal(out=self._normals)
+        drift, pos_noise = normals[0:3], normals[3:6]
+        accel, gyro = normals[6:9], normals[9:12]
+        
         # Add drift to gyro
-        self.gyro_drift += np.random.normal(0, self.drift_rate, 3)
+        drift *= self.drift_rate
+        self.gyro_drift += drift
         
         # Add noise to orientation
-        noise_quat = Quaternion.random()
-        fused_quat = Quaternion.slerp(true_quat, noise_quat, amount=self.noise_level)
+        noise_quat = quat_random(self.rng.random(out=self._uniforms))
+        fused_quat = quat_slerp(true_quat, noise_quat, self.noise_level)
         
         # Add noise to position
-        noisy_pos = true_pos + np.random.normal(0, self.pos_noise, 3)
+        pos_noise *= self.pos_noise
+        noisy_pos = true_pos + pos_noise
+        
+        accel *= 0.05  # Simulated accel
+        gyro *= 0.01   # Simulated gyro
+        gyro += self.gyro_drift
         
         return {
             "quat": fused_quat,
             "pos": noisy_pos,
-            "accel": np.random.normal(0, 0.05, 3),  # Simulated accel
-            "gyro": self.gyro_drift + np.random.normal(0, 0.01, 3)  # Simulated gyro
+            "accel": accel,
+            "gyro": gyro
         }
 
     def update_demo_movement(self, time_step):
@@ -49,7 +66,8 @@ class IMU_Simulator:
         pitch = 0.1 * np.cos(t * 0.3)
         
         # Update ground truth orientation
-        target_quat = Quaternion(axis=[0, 0, 1], angle=yaw) * Quaternion(axis=[1, 0, 0], angle=pitch)
+        target_quat = quat_mul(quat_from_axis_angle(np.array([0.0, 0.0, 1.0]), yaw),
+                               quat_from_axis_angle(np.array([1.0, 0.0, 0.0]), pitch))
         
         # Update ground truth position (slight sway)
         target_pos = np.array([0.1 * np.sin(t * 0.2), 0.1 * np.cos(t * 0.2), 1.6])
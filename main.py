@@ -8,7 +8,7 @@ from imu_simulator import IMU_Simulator
 from sensor_fusion import SensorFusion
 from audio_engine import AudioEngine
 from dsp_pipeline import DSPPipeline
-from pyquaternion import Quaternion
+from quat_ops import quat_mul, quat_from_axis_angle
 
 # Optional dependency for keyboard control
 try:
@@ -17,6 +17,18 @@ except ImportError:
     keyboard = None
 
 class MudumalaiSystem:
+    # Manual control: key -> (dx, dy, dyaw, dpitch) applied per 100Hz tick while held
+    KEY_BINDINGS = {
+        'w': (0.0, 0.05, 0.0, 0.0),
+        's': (0.0, -0.05, 0.0, 0.0),
+        'a': (-0.05, 0.0, 0.0, 0.0),
+        'd': (0.05, 0.0, 0.0, 0.0),
+        'left': (0.0, 0.0, 3.0, 0.0),
+        'right': (0.0, 0.0, -3.0, 0.0),
+        'up': (0.0, 0.0, 0.0, 2.0),
+        'down': (0.0, 0.0, 0.0, -2.0),
+    }
+
     def __init__(self):
         self.sample_rate = 96000
         self.chunk_size = 1024
@@ -30,45 +42,66 @@ class MudumalaiSystem:
         
         # State
         self.current_pos = np.array([0.0, 0.0, 1.6])
-        self.current_quat = Quaternion(1, 0, 0, 0)
+        self.current_quat = np.array([1.0, 0.0, 0.0, 0.0])
         self.base_pos = np.array([0.0, 0.0, 1.6])
         self.base_yaw = 0.0
         self.base_pitch = 0.0
         self.start_time = time.time()
         self.demo_mode = True
         
+        # Held keys are tracked by keyboard hooks, not polled in the ISR
+        self.held_keys = set()
+        if keyboard:
+            self._register_key_hooks()
+        
+        # Prime the DSP chain before the real-time callback can run
+        self._warmup_dsp()
+        
         # Audio Stream
         self.stream = sd.OutputStream(
             samplerate=self.sample_rate,
             blocksize=self.chunk_size,
             channels=2,
+            dtype='float32',
             callback=self._audio_callback
         )
 
+    def _warmup_dsp(self):
+        """Runs one silent chunk (and a Doppler pass) through the DSP chain."""
+        # The JIT kernels are compiled at import from their signatures; this
+        # also moves first-call FFT/dispatch setup off the audio thread.
+        chunks = np.zeros((len(self.audio.sources), self.chunk_size), dtype=np.float32)
+        self.pipeline.env.apply_doppler(chunks[0], 1.0)
+        self.pipeline.process(chunks, self.audio.positions, self.current_pos, self.current_quat)
+
+    def _register_key_hooks(self):
+        """Registers press/release hooks once for every control key."""
+        for key in self.KEY_BINDINGS:
+            keyboard.on_press_key(key, lambda _, k=key: self._on_key_press(k))
+            keyboard.on_release_key(key, lambda _, k=key: self.held_keys.discard(k))
+
+    def _on_key_press(self, key):
+        self.held_keys.add(key)
+        # Disable demo if user interacts
+        self.demo_mode = False
+
     def _timer_interrupt_100hz(self):
         """STM32 Timer Interrupt (100Hz) - Sensor Fusion and Update Positioning."""
-        # 1. Check Keyboard Inputs (Manual Control)
-        if keyboard:
-            if keyboard.is_pressed('w'): self.base_pos[1] += 0.05
-            if keyboard.is_pressed('s'): self.base_pos[1] -= 0.05
-            if keyboard.is_pressed('a'): self.base_pos[0] -= 0.05
-            if keyboard.is_pressed('d'): self.base_pos[0] += 0.05
-            if keyboard.is_pressed('left'): self.base_yaw += 3.0
-            if keyboard.is_pressed('right'): self.base_yaw -= 3.0
-            if keyboard.is_pressed('up'): self.base_pitch += 2.0
-            if keyboard.is_pressed('down'): self.base_pitch -= 2.0
-            
-            # Disable demo if user interacts
-            if any(keyboard.is_pressed(k) for k in ['w','s','a','d','left','right','up','down']):
-                self.demo_mode = False
+        # 1. Apply held Keyboard Inputs (Manual Control), cached by the hooks
+        for key in tuple(self.held_keys):
+            dx, dy, dyaw, dpitch = self.KEY_BINDINGS[key]
+            self.base_pos[0] += dx
+            self.base_pos[1] += dy
+            self.base_yaw += dyaw
+            self.base_pitch += dpitch
 
         # 2. Get Raw Data (Demo or Manual)
         if self.demo_mode:
             elapsed = time.time() - self.start_time
             raw_data = self.imu.update_demo_movement(elapsed)
         else:
-            target_quat = Quaternion(axis=[0, 0, 1], angle=np.radians(self.base_yaw)) * \
-                          Quaternion(axis=[1, 0, 0], angle=np.radians(self.base_pitch))
+            target_quat = quat_mul(quat_from_axis_angle(np.array([0.0, 0.0, 1.0]), np.radians(self.base_yaw)),
+                                   quat_from_axis_angle(np.array([1.0, 0.0, 0.0]), np.radians(self.base_pitch)))
             raw_data = self.imu.get_raw_data(target_quat, self.base_pos)
         
         # 3. Execute Kalman filtering
@@ -82,18 +115,18 @@ class MudumalaiSystem:
             print(f"Audio Error: {status}")
             
         # 1. Get audio chunks from all 6 sources
-        sources_data = self.audio.get_source_chunks()
+        positions, chunks = self.audio.get_source_chunks()
         
-        # 2. Process through DSP Pipeline
-        final_l, final_r = self.pipeline.process(
-            sources_data, 
+        # 2. Process through DSP Pipeline, writing directly into the
+        #    interleaved output channels
+        self.pipeline.process(
+            chunks,
+            positions,
             self.current_pos, 
-            self.current_quat
+            self.current_quat,
+            outdata[:, 0],
+            outdata[:, 1]
         )
-        
-        # 3. Interleave and write to output
-        outdata[:, 0] = final_l
-        outdata[:, 1] = final_r
 
     def start(self):
         print("\n" + "="*40)
@@ -0,0 +1,94 @@
+import numpy as np
+from numba import njit
+
+# Quaternions are plain float64 arrays [w, x, y, z], so the real-time paths
+# never create Python-level quaternion objects.
+
+@njit('f8[::1](f8[::1])', cache=True)
+def quat_normalize(q):
+    """Returns q scaled to unit length."""
+    return q / np.sqrt(q[0]*q[0] + q[1]*q[1] + q[2]*q[2] + q[3]*q[3])
+
+@njit('f8[::1](f8[::1], f8[::1])', cache=True)
+def quat_mul(a, b):
+    """Hamilton product a * b."""
+    out = np.empty(4)
+    out[0] = a[0]*b[0] - a[1]*b[1] - a[2]*b[2] - a[3]*b[3]
+    out[1] = a[0]*b[1] + a[1]*b[0] + a[2]*b[3] - a[3]*b[2]
+    out[2] = a[0]*b[2] - a[1]*b[3] + a[2]*b[0] + a[3]*b[1]
+    out[3] = a[0]*b[3] + a[1]*b[2] - a[2]*b[1] + a[3]*b[0]
+    return out
+
+@njit('f8[::1](f8[::1])', cache=True)
+def quat_inverse(q):
+    """Conjugate divided by squared norm."""
+    norm_sq = q[0]*q[0] + q[1]*q[1] + q[2]*q[2] + q[3]*q[3]
+    out = np.empty(4)
+    out[0] = q[0] / norm_sq
+    out[1] = -q[1] / norm_sq
+    out[2] = -q[2] / norm_sq
+    out[3] = -q[3] / norm_sq
+    return out
+
+@njit('f8[::1](f8[::1], f8)', cache=True)
+def quat_from_axis_angle(axis, angle):
+    """Rotation of `angle` radians about `axis`."""
+    axis = axis / np.sqrt(axis[0]*axis[0] + axis[1]*axis[1] + axis[2]*axis[2])
+    s = np.sin(angle / 2.0)
+    out = np.empty(4)
+    out[0] = np.cos(angle / 2.0)
+    out[1] = axis[0] * s
+    out[2] = axis[1] * s
+    out[3] = axis[2] * s
+    return out
+
+@njit('f8[::1](f8[::1])', cache=True)
+def quat_random(u):
+    """
+    Uniformly distributed unit quaternion (Shoemake's method).
+    u: three uniform samples in [0, 1)
+    """
+    out = np.empty(4)
+    out[0] = np.sqrt(1.0 - u[0]) * np.sin(2 * np.pi * u[1])
+    out[1] = np.sqrt(1.0 - u[0]) * np.cos(2 * np.pi * u[1])
+    out[2] = np.sqrt(u[0]) * np.sin(2 * np.pi * u[2])
+    out[3] = np.sqrt(u[0]) * np.cos(2 * np.pi * u[2])
+    return out
+
+@njit('f8[::1](f8[::1], f8[::1], f8)', cache=True)
+def quat_slerp(q0, q1, t):
+    """Spherical linear interpolation from q0 (t=0) to q1 (t=1), shortest path."""
+    q0 = quat_normalize(q0)
+    q1 = quat_normalize(q1)
+    dot = q0[0]*q1[0] + q0[1]*q1[1] + q0[2]*q1[2] + q0[3]*q1[3]
+    if dot < 0.0:
+        q0 = -q0
+        dot = -dot
+    
+    # Nearly parallel: fall back to normalized linear interpolation
+    if dot > 0.9995:
+        return quat_normalize(q0 + t * (q1 - q0))
+    
+    theta_0 = np.arccos(dot)
+    sin_theta_0 = np.sin(theta_0)
+    theta = theta_0 * t
+    sin_theta = np.sin(theta)
+    s0 = np.cos(theta) - dot * sin_theta / sin_theta_0
+    s1 = sin_theta / sin_theta_0
+    return quat_normalize(s0 * q0 + s1 * q1)
+
+@njit('f8[:, ::1](f8[::1])', cache=True)
+def quat_to_rotmat(q):
+    """3x3 rotation matrix of the (normalized) quaternion."""
+    w, x, y, z = quat_normalize(q)
+    out = np.empty((3, 3))
+    out[0, 0] = 1.0 - 2.0 * (y*y + z*z)
+    out[0, 1] = 2.0 * (x*y - w*z)
+    out[0, 2] = 2.0 * (x*z + w*y)
+    out[1, 0] = 2.0 * (x*y + w*z)
+    out[1, 1] = 1.0 - 2.0 * (x*x + z*z)
+    out[1, 2] = 2.0 * (y*z - w*x)
+    out[2, 0] = 2.0 * (x*z - w*y)
+    out[2, 1] = 2.0 * (y*z + w*x)
+    out[2, 2] = 1.0 - 2.0 * (x*x + y*y)
+    return out
@@ -1,5 +1,22 @@
 import numpy as np
-from pyquaternion import Quaternion
+from numba import njit
+from quat_ops import quat_slerp
+
+@njit('f8[:, ::1](f8[:, ::1])', cache=True)
+def _inv3(m):
+    """Closed-form (cofactor) inverse of a 3x3 matrix."""
+    out = np.empty((3, 3))
+    out[0, 0] = m[1, 1] * m[2, 2] - m[1, 2] * m[2, 1]
+    out[0, 1] = m[0, 2] * m[2, 1] - m[0, 1] * m[2, 2]
+    out[0, 2] = m[0, 1] * m[1, 2] - m[0, 2] * m[1, 1]
+    out[1, 0] = m[1, 2] * m[2, 0] - m[1, 0] * m[2, 2]
+    out[1, 1] = m[0, 0] * m[2, 2] - m[0, 2] * m[2, 0]
+    out[1, 2] = m[0, 2] * m[1, 0] - m[0, 0] * m[1, 2]
+    out[2, 0] = m[1, 0] * m[2, 1] - m[1, 1] * m[2, 0]
+    out[2, 1] = m[0, 1] * m[2, 0] - m[0, 0] * m[2, 1]
+    out[2, 2] = m[0, 0] * m[1, 1] - m[0, 1] * m[1, 0]
+    det = m[0, 0] * out[0, 0] + m[0, 1] * out[1, 0] + m[0, 2] * out[2, 0]
+    return out / det
 
 class KalmanFilter3D:
     """
@@ -19,7 +36,7 @@ class KalmanFilter3D:
         # Measurement Noise (UWB ±15cm)
         self.pos_R = np.eye(3) * 0.15
         
-        # Transition Matrix
+        # Transition Matrix (predict/update use its expanded block form)
         self.pos_F = np.eye(6)
         self.pos_F[0, 3] = dt
         self.pos_F[1, 4] = dt
@@ -32,37 +49,44 @@ class KalmanFilter3D:
         self.pos_H[2, 2] = 1
 
     def predict(self):
-        # Position Prediction
-        self.pos_state = self.pos_F @ self.pos_state
-        self.pos_P = self.pos_F @ self.pos_P @ self.pos_F.T + self.pos_Q
+        # Position Prediction: x = F x with F = [[I, dt*I], [0, I]]
+        dt = self.dt
+        self.pos_state[:3] += dt * self.pos_state[3:]
+        
+        # P = F P F^T + Q, expanded per 3x3 block (velocity block unchanged)
+        P = self.pos_P
+        P[:3, :3] += dt * (P[3:, :3] + P[:3, 3:]) + dt * dt * P[3:, 3:]
+        P[:3, 3:] += dt * P[3:, 3:]
+        P[3:, :3] += dt * P[3:, 3:]
+        P += self.pos_Q
 
     def update_position(self, z):
-        # Measurement Update
-        y = z - self.pos_H @ self.pos_state  # Innovation
-        S = self.pos_H @ self.pos_P @ self.pos_H.T + self.pos_R
-        K = self.pos_P @ self.pos_H.T @ np.linalg.inv(S)  # Kalman Gain
+        # Measurement Update (H selects the position rows of the state)
+        y = z - self.pos_state[:3]  # Innovation
+        S = self.pos_P[:3, :3] + self.pos_R
+        K = self.pos_P[:, :3] @ _inv3(S)  # Kalman Gain
         
-        self.pos_state = self.pos_state + K @ y
-        self.pos_P = (np.eye(6) - K @ self.pos_H) @ self.pos_P
+        self.pos_state += K @ y
+        self.pos_P -= K @ self.pos_P[:3, :]
 
     def filter_orientation(self, quat_measure, last_quat, alpha=0.9):
         """
         Simple complementary filter for orientation instead of EKF for simplicity.
         In a firmware context, this saves cycles while remaining effective.
         """
-        return Quaternion.slerp(last_quat, quat_measure, amount=(1.0 - alpha))
+        return quat_slerp(last_quat, quat_measure, 1.0 - alpha)
 
 class SensorFusion:
     def __init__(self):
         self.kf = KalmanFilter3D()
         self.current_pos = np.array([0.0, 0.0, 1.6])
-        self.current_quat = Quaternion(1, 0, 0, 0)
+        self.current_quat = np.array([1.0, 0.0, 0.0, 0.0])
 
     def update(self, raw_data):
         # Position Update
         self.kf.predict()
         self.kf.update_position(raw_data['pos'])
-        self.current_pos = self.kf.pos_state[:3]
+        self.current_pos = self.kf.pos_state[:3].copy()  # state is updated in place
         
         # Orientation Update
         self.current_quat = self.kf.filter_orientation(raw_data['quat'], self.current_quat)
@@ -74,6 +98,6 @@ class SensorFusion:
 
 if __name__ == "__main__":
     fusion = SensorFusion()
-    raw = {"pos": np.array([0.1, 0.1, 1.65]), "quat": Quaternion(1, 0, 0.1, 0)}
+    raw = {"pos": np.array([0.1, 0.1, 1.65]), "quat": np.array([1.0, 0.0, 0.1, 0.0])}
     fused = fusion.update(raw)
     print(f"Fused Pos: {fused['pos']}, Fused Quat: {fused['quat']}")
@@ -1,95 +1,633 @@
+import os
+import gc
 import time
+import sys
+import ctypes
+import logging
+import _thread
 import threading
+import types
 import numpy as np
+from numba import njit
+from numba.core.ccallback import CFunc
+
+try:
+    import cffi
+    _ffi = cffi.FFI()
+except ImportError:
+    _ffi = None
+
+# Silent unless the application configures logging
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Kernel periodic timer (Linux timerfd). The timer thread blocks in read()
+# on the fd, which releases the GIL, so it only takes it to run the callback.
+CLOCK_MONOTONIC = 1
+TFD_TIMER_ABSTIME = 1
+TFD_CLOEXEC = 0o2000000
+
+class _timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+class _itimerspec(ctypes.Structure):
+    _fields_ = [("it_interval", _timespec), ("it_value", _timespec)]
+
+_timerfd_create = None
+_timerfd_settime = None
+if sys.platform.startswith("linux"):
+    try:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _timerfd_create = _libc.timerfd_create
+        _timerfd_create.argtypes = [ctypes.c_int, ctypes.c_int]
+        _timerfd_create.restype = ctypes.c_int
+        _timerfd_settime = _libc.timerfd_settime
+        _timerfd_settime.argtypes = [ctypes.c_int, ctypes.c_int,
+                                     ctypes.POINTER(_itimerspec), ctypes.POINTER(_itimerspec)]
+        _timerfd_settime.restype = ctypes.c_int
+    except (OSError, AttributeError):
+        _timerfd_create = None
+
+def _to_timespec(seconds):
+    sec = int(seconds)
+    return _timespec(sec, int((seconds - sec) * 1e9))
+
+def _open_timerfd(first_deadline, period):
+    """
+    Arms a CLOCK_MONOTONIC timerfd that first fires at `first_deadline`
+    (a time.perf_counter() value, which is CLOCK_MONOTONIC on Linux) and
+    then every `period` seconds. Returns the fd, or None if unavailable.
+    """
+    if _timerfd_create is None:
+        return None
+    fd = _timerfd_create(CLOCK_MONOTONIC, TFD_CLOEXEC)
+    if fd < 0:
+        return None
+    spec = _itimerspec(_to_timespec(period), _to_timespec(first_deadline))
+    if _timerfd_settime(fd, TFD_TIMER_ABSTIME, ctypes.byref(spec), None) != 0:
+        os.close(fd)
+        return None
+    return fd
+
+# DMA buffers hold raw 16-bit PCM, as the STM32H7 I2S peripheral moves it;
+# callbacks promote to float only if they need to (see to_float32)
+DMA_DTYPE = np.int16
+PCM16_SCALE = 1.0 / 32768.0
+IN_DATA_ERROR = "DMA input must be a C-contiguous int16 ndarray of buffer_size samples"
+OUT_BATCH_ERROR = "in_batch/out_batch must be C-contiguous int16 ndarrays of the same (N, buffer_size) shape"
+
+# Compiled DMA callback: void cb(const int16_t *in, int16_t *out, int n).
+# Buffers are passed as raw addresses (ABI-identical to int16_t*) so no ctypes
+# pointer objects are built per call; ctypes drops the GIL for the call.
+DMA_CALLBACK_TYPE = ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int)
+
+# Final stretch of the fallback wait that is busy-spun instead of slept,
+# since time.sleep overshoots by up to a scheduler quantum. Each spin
+# iteration is a time.sleep(0), which drops the GIL so other Python threads
+# (e.g. the sounddevice callback) are not blocked for the whole stretch.
+SPIN_THRESHOLD = 0.002
+
+def _native_callback_address(cb):
+    """
+    Entry address of a compiled callback (numba cfunc, cffi function pointer or
+    ctypes function pointer), or None for an ordinary Python callable.
+    """
+    if isinstance(cb, CFunc):
+        return cb.address
+    if isinstance(cb, ctypes._CFuncPtr):
+        return ctypes.cast(cb, ctypes.c_void_p).value
+    if _ffi is not None and isinstance(cb, _ffi.CData):
+        return int(_ffi.cast("uintptr_t", cb))
+    return None
+
+@njit(['void(i2[::1], f4, i2[::1])', 'void(f4[::1], f4, f4[::1])'], cache=True, fastmath=True)
+def dma_gain(in_data, gain, out):
+    """out[:] = in_data * gain (gain <= 1 for PCM); building block for compiled DMA callbacks."""
+    for i in range(in_data.shape[0]):
+        out[i] = in_data[i] * gain
+
+def _is_dma_layout(data, shape):
+    """True if data is a C-contiguous DMA_DTYPE ndarray of exactly `shape`."""
+    return (isinstance(data, np.ndarray) and data.dtype == DMA_DTYPE
+            and data.flags.c_contiguous and data.shape == shape)
+
+def to_float32(data, out=None):
+    """Converts int16 PCM to float32 in [-1, 1), optionally into `out`."""
+    return np.multiply(data, np.float32(PCM16_SCALE), out=out, dtype=np.float32)
+
+def _sleep_until(deadline, perf_counter=time.perf_counter, sleep=time.sleep, yield_gil=time.sleep):
+    """
+    Fallback tick wait for platforms without timerfd: sleeps coarsely until
+    SPIN_THRESHOLD before the deadline, then spins on perf_counter, yielding
+    the GIL on every iteration.
+    `sleep` may be an Event.wait; returns True if it was woken by the event.
+    """
+    remaining = deadline - perf_counter()
+    if remaining > SPIN_THRESHOLD and sleep(remaining - SPIN_THRESHOLD):
+        return True
+    while perf_counter() < deadline:
+        yield_gil(0)
+    return False
 
 class STM32_Controller:
     """
     Simulates an STM32H7 (Cortex-M7) controller behavior at 96kHz.
     Includes a 100Hz timer interrupt and dual-buffer DMA-style callbacks.
     """
-    def __init__(self, sample_rate=96000, buffer_size=1024):
+    # Fixed attribute layout; slots are laid out in this order, so the
+    # per-buffer DMA state comes first and sits together
+    __slots__ = (
+        # DMA hot path
+        '_dma_handler', 'processed_buffers', 'audio_dma_callback', '_c_callback', '_c_callback_owner',
+        'dma_buffers', '_dma_buffer_ptrs', 'buffer_size', '_batch_out',
+        # SPSC ring
+        'dma_ring', '_ring_mask', '_ring_head', '_ring_tail', '_dma_ready', 'dma_overruns',
+        'dma_out_ring', '_out_head', '_out_tail',
+        # Timer
+        'timer_callback', 'timer_period', 'next_deadline', 'timer_jitter', 'missed_ticks',
+        # Setup / lifecycle
+        'sample_rate', 'timer_cpu', 'dma_cpu', 'timer_priority', '_stop_event', '_gc_frozen',
+        '_timer_exited', '_dma_exited', '_dma_thread_cpu',
+    )
+
+    def __init__(self, sample_rate=96000, buffer_size=1024, timer_cpu=None, timer_priority=80,
+                 ring_slots=8, dma_cpu=None):
         self.sample_rate = sample_rate
         self.buffer_size = buffer_size
-        self.running = False
-        self.timer_thread = None
+        # Real-time placement of the timer and DMA-consumer threads (best effort,
+        # Linux only). Each gets its own core, away from the lowest allowed one,
+        # which is left to the main thread and GC. None picks the highest free
+        # CPUs we may run on. For bare-metal-like latency reserve the cores at
+        # boot (e.g. isolcpus=1,2 nohz_full=1,2) and pass timer_cpu=1, dma_cpu=2.
+        self.timer_cpu = timer_cpu
+        self.dma_cpu = dma_cpu
+        self.timer_priority = timer_priority
+        self._stop_event = threading.Event()
+        self._stop_event.set()  # Not running until start()
+        self._gc_frozen = False
+        self._timer_exited = None
         self.audio_dma_callback = None
         self.timer_callback = None
         
         # Performance monitoring
-        self.last_timer_time = 0
+        self.timer_period = 0.01  # 100Hz = 10ms
+        self.next_deadline = 0
         self.timer_jitter = 0
+        self.missed_ticks = 0
         
         # DMA State: Double-buffering simulation
-        self.dma_buffer_idx = 0  # 0 or 1 for half-buffer completion
+        # The half-buffer index (0 or 1) is the low bit of the buffer count,
+        # so each completion costs a single counter store
         self.processed_buffers = 0
+        self.dma_buffers = [np.empty(buffer_size, dtype=DMA_DTYPE),
+                            np.empty(buffer_size, dtype=DMA_DTYPE)]
+        self._dma_buffer_ptrs = [buf.ctypes.data for buf in self.dma_buffers]
+        self._batch_out = np.empty((0, buffer_size), dtype=DMA_DTYPE)  # Grown on demand
+        # Rebound to a specialized version while running (see _specialize_dma)
+        self._dma_handler = self._process_audio_dma_generic
+        self._c_callback = None
+        self._c_callback_owner = None  # Keeps the registered thunk/cdata alive
+        
+        # SPSC ring between the DMA producer (push_audio_dma) and the consumer
+        # thread running the audio callback. Slot count is a power of two so
+        # the index wraps with a mask; head is only written by the producer,
+        # tail only by the consumer, so no lock guards the slots.
+        ring_slots = 1 << (max(ring_slots, 2) - 1).bit_length()
+        self.dma_ring = np.empty((ring_slots, buffer_size), dtype=DMA_DTYPE)
+        self._ring_mask = ring_slots - 1
+        self._ring_head = 0
+        self._ring_tail = 0
+        self._dma_ready = threading.Event()  # Doorbell only, never guards data
+        self.dma_overruns = 0
+        # Results flow back the same way: the consumer thread produces into
+        # dma_out_ring and the caller drains it with pop_audio_dma. A full
+        # output ring holds the consumer back, which surfaces as push overruns.
+        self.dma_out_ring = np.empty_like(self.dma_ring)
+        self._out_head = 0
+        self._out_tail = 0
+        # The consumer thread is spawned by the first push after start()
+        self._dma_exited = None
+        self._dma_thread_cpu = None
 
     def start(self, timer_cb, audio_cb):
         """
         Starts the simulation with specified callbacks.
         timer_cb: Function to call at 100Hz.
-        audio_cb: Function to call for audio buffer processing.
+        audio_cb: Function called as audio_cb(in_data, out_buffer) on int16 PCM
+                  buffers (DMA_DTYPE); it must write its result into out_buffer
+                  in place rather than return a new array.
+                  Ideally an @njit function (or a thin wrapper around one, e.g.
+                  dma_gain) so the DMA thread never runs interpreted sample loops.
+                  A numba cfunc / cffi / ctypes function pointer with the
+                  register_c_callback signature is detected and dispatched natively.
+                  audio_cb replaces any previously registered callback, native or not.
+        The callback is baked into the specialized DMA handler, so assigning
+        audio_dma_callback while running has no effect; use register_c_callback
+        or restart to swap it. Raises RuntimeError if already running; call
+        stop() first.
         """
+        if self.running:
+            raise RuntimeError("STM32 simulation already running; stop() it first")
         self.timer_callback = timer_cb
+        if _native_callback_address(audio_cb) is not None:
+            # register_c_callback holds the reference that keeps it alive
+            self.register_c_callback(audio_cb)
+            audio_cb = None
+        else:
+            self.register_c_callback(None)
         self.audio_dma_callback = audio_cb
-        self.running = True
+        # Compile/prime the audio path now rather than on the first DMA tick
+        self.jit_warmup()
+        self._specialize_dma()
+        self._stop_event.clear()
         
-        # Start timer thread (100Hz = 10ms period)
-        self.timer_thread = threading.Thread(target=self._timer_loop, daemon=True)
-        self.timer_thread.start()
+        # Start timer thread (100Hz = 10ms period) on an absolute schedule
+        self.next_deadline = time.perf_counter() + self.timer_period
+        # Move everything allocated so far out of the collector's reach so a
+        # GC pass can't stall a tick. Only if nobody else froze the heap, so
+        # stop() can safely undo it.
+        self._gc_frozen = gc.get_freeze_count() == 0
+        if self._gc_frozen:
+            gc.freeze()
+        timer_cpu, self._dma_thread_cpu = self._thread_cpus()
+        self._timer_exited = self._spawn(self._timer_loop, timer_cpu)
+        if self._ring_head != self._ring_tail:
+            # Buffers pushed while stopped still need draining
+            self._dma_exited = self._spawn(self._dma_consumer_loop, self._dma_thread_cpu)
         
-        print(f"STM32 Simulation Started ({self.sample_rate}Hz, 100Hz Timer, Dual-DMA)")
+        logger.info("STM32 Simulation Started (%dHz, 100Hz Timer, Dual-DMA)", self.sample_rate)
+
+    def jit_warmup(self, sample_shape=None, dtype=DMA_DTYPE):
+        """
+        Runs the registered audio callback(s) once on a silent dummy buffer so
+        any lazy JIT compilation happens outside real-time processing.
+        DMA state (buffers, counters) is left untouched.
+        """
+        if sample_shape is None:
+            sample_shape = (self.buffer_size,)
+        dummy_in = np.zeros(sample_shape, dtype=dtype)
+        dummy_out = np.empty_like(dummy_in)
+        if self._c_callback is not None:
+            self._c_callback(dummy_in.ctypes.data, dummy_out.ctypes.data, dummy_in.size)
+        if self.audio_dma_callback is not None:
+            self.audio_dma_callback(dummy_in, dummy_out)
 
     def stop(self):
-        self.running = False
-        if self.timer_thread:
-            # Note: joining daemon thread might not be necessary but good for cleanup
+        self._stop_event.set()
+        self._dma_ready.set()  # Wake an idle consumer so it sees the stop
+        # The timer thread wakes at its next tick (or at once from the fallback wait)
+        for exited in (self._timer_exited, self._dma_exited):
+            if exited is not None:
+                exited.acquire()  # Join
+        self._timer_exited = None
+        self._dma_exited = None
+        # Callbacks may be swapped while stopped; go back to the generic path
+        self._dma_handler = self._process_audio_dma_generic
+        if self._gc_frozen:
+            # Hand the heap back to the collector so garbage from this run
+            # (and earlier ones) can still be reclaimed
+            gc.unfreeze()
+            self._gc_frozen = False
+        logger.info("STM32 Simulation Stopped")
+
+    @property
+    def running(self):
+        return not self._stop_event.is_set()
+
+    @property
+    def dma_buffer_idx(self):
+        """Half-buffer last completed (0 or 1)."""
+        return self.processed_buffers & 1
+
+    @staticmethod
+    def _spawn(target, *args):
+        """
+        Runs target(*args) on a bare _thread thread, skipping threading.Thread's
+        bookkeeping. Such threads are inherently daemonic. Returns a lock that is
+        held until the thread exits; acquiring it joins the thread.
+        """
+        exited = _thread.allocate_lock()
+        exited.acquire()
+        
+        def run():
+            try:
+                target(*args)
+            finally:
+                exited.release()
+        
+        _thread.start_new_thread(run, ())
+        return exited
+
+    def _thread_cpus(self):
+        """Resolves (timer_cpu, dma_cpu), filling unset ones from the allowed set."""
+        timer_cpu, dma_cpu = self.timer_cpu, self.dma_cpu
+        try:
+            allowed = sorted(os.sched_getaffinity(0))
+        except AttributeError:
+            return timer_cpu, dma_cpu
+        # Never hand out the lowest allowed core; that one stays with main/GC
+        spare = [cpu for cpu in allowed[1:] if cpu not in (timer_cpu, dma_cpu)]
+        if timer_cpu is None and spare:
+            timer_cpu = spare.pop()
+        if dma_cpu is None and spare:
+            dma_cpu = spare.pop()
+        return timer_cpu, dma_cpu
+
+    @staticmethod
+    def _pin_thread(native_id, cpu):
+        """Pins a thread to one CPU; silently skipped where unsupported."""
+        if cpu is None:
+            return
+        try:
+            os.sched_setaffinity(native_id, {cpu})
+        except (AttributeError, OSError):
             pass
-        print("STM32 Simulation Stopped")
 
-    def _timer_loop(self):
+    def _set_realtime_priority(self):
+        """Promotes the calling thread to SCHED_FIFO (needs CAP_SYS_NICE / rtprio)."""
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.timer_priority))
+        except (AttributeError, OSError) as e:
+            logger.warning("STM32 Timer: running without SCHED_FIFO (%s)", e)
+
+    def _timer_loop(self, cpu=None):
         """100Hz hardware timer interrupt simulation."""
-        target_period = 0.01  # 10ms
-        self.last_timer_time = time.perf_counter()
+        self._pin_thread(threading.get_native_id(), cpu)
+        self._set_realtime_priority()
+        # Bind everything the loop touches to locals once
+        target_period = self.timer_period
+        next_deadline = self.next_deadline
+        cb = self.timer_callback
+        stopped = self._stop_event.is_set
+        wait = self._stop_event.wait
+        perf_counter = time.perf_counter
+        read = os.read
+        from_bytes = int.from_bytes
+        byteorder = sys.byteorder
+        fd = _open_timerfd(next_deadline, target_period)
         
-        while self.running:
-            current_time = time.perf_counter()
-            elapsed = current_time - self.last_timer_time
-            
-            if elapsed >= target_period:
-                self.timer_jitter = elapsed - target_period
-                self.last_timer_time = current_time
+        try:
+            while not stopped():
+                if fd is not None:
+                    # Blocks until the kernel timer expires; the 8-byte payload
+                    # is the number of expirations since the last read
+                    expirations = from_bytes(read(fd, 8), byteorder)
+                else:
+                    if _sleep_until(next_deadline, sleep=wait):
+                        break
+                    expirations = 1 + int((perf_counter() - next_deadline) // target_period)
                 
-                if self.timer_callback:
-                    # Execute control logic (e.g., sensor fusion update)
-                    self.timer_callback()
-            
-            # Yield to CPU
-            time.sleep(0.001)
+                # Deadlines advance by exactly one period regardless of when we
+                # actually woke, so wake-up latency never accumulates into drift
+                self.timer_jitter = perf_counter() - next_deadline
+                if expirations > 1:
+                    self.missed_ticks += expirations - 1
+                
+                # Run the interrupt once per expiration so late wake-ups catch up
+                for _ in range(expirations):
+                    next_deadline += target_period
+                    if cb is not None:
+                        # Execute control logic (e.g., sensor fusion update)
+                        cb()
+                self.next_deadline = next_deadline
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def register_c_callback(self, cfunc_ptr):
+        """
+        Registers a compiled audio callback, `void cb(const int16_t *in, int16_t *out, int n)`,
+        given as a raw address, a numba cfunc, or a cffi / ctypes function pointer.
+        It takes precedence over audio_dma_callback; pass None to unregister.
+        The object passed in is kept referenced while registered, since freeing a
+        ctypes/cffi callback frees the code its address points at. A raw address
+        must be kept valid by the caller.
+        """
+        if cfunc_ptr is None:
+            self._c_callback = None
+            self._c_callback_owner = None
+        else:
+            address = cfunc_ptr
+            if not isinstance(address, int):
+                address = _native_callback_address(cfunc_ptr)
+                if address is None:
+                    raise TypeError("register_c_callback expects a compiled function pointer")
+            self._c_callback = DMA_CALLBACK_TYPE(address)
+            self._c_callback_owner = cfunc_ptr
+        if self.running:
+            self._specialize_dma()
+
+    def push_audio_dma(self, in_data):
+        """
+        DMA transfer-complete side: copies one buffer into the ring and returns
+        immediately. Returns False (and counts an overrun) if the consumer has
+        fallen a full ring behind. Processed output is collected, in order,
+        with pop_audio_dma; callers must keep draining it, since processing
+        pauses while the output ring is full. in_data must match the ring
+        layout (see process_audio_dma) so it is never silently cast.
+        """
+        assert _is_dma_layout(in_data, (self.buffer_size,)), IN_DATA_ERROR
+        head = self._ring_head
+        if head - self._ring_tail > self._ring_mask:
+            self.dma_overruns += 1
+            return False
+        self.dma_ring[head & self._ring_mask] = in_data
+        # Publish only after the copy; attribute stores are ordered under the GIL
+        self._ring_head = head + 1
+        if self._dma_exited is None and self.running:
+            self._dma_exited = self._spawn(self._dma_consumer_loop, self._dma_thread_cpu)
+        self._dma_ready.set()
+        return True
+
+    def pop_audio_dma(self, out_buffer):
+        """
+        Copies the oldest processed buffer from the output ring into out_buffer.
+        Returns False if no processed buffer is waiting.
+        """
+        tail = self._out_tail
+        if tail == self._out_head:
+            return False
+        np.copyto(out_buffer, self.dma_out_ring[tail & self._ring_mask])
+        # Release the slot only after the copy, then wake a consumer that
+        # may be waiting for output space
+        self._out_tail = tail + 1
+        self._dma_ready.set()
+        return True
+
+    def _dma_consumer_loop(self, cpu=None):
+        """Drains the ring, running the audio callback off the producer's thread."""
+        self._pin_thread(threading.get_native_id(), cpu)
+        ring = self.dma_ring
+        out_ring = self.dma_out_ring
+        mask = self._ring_mask
+        ready = self._dma_ready
+        stopped = self._stop_event.is_set
+        
+        while not stopped():
+            tail = self._ring_tail
+            out_head = self._out_head
+            # Idle when there is no input, or no room to publish the result
+            if tail == self._ring_head or out_head - self._out_tail > mask:
+                # Clear before re-checking so a push/pop/stop in between still
+                # wakes us; each of them rings the doorbell, so no timeout
+                ready.clear()
+                if not stopped() and (tail == self._ring_head or out_head - self._out_tail > mask):
+                    ready.wait()
+                continue
+            # Looked up per buffer: the handler is rebound if the callback changes
+            out_ring[out_head & mask] = self._dma_handler(ring[tail & mask])
+            self._out_head = out_head + 1
+            self._ring_tail = tail + 1
+
+    def _specialize_dma(self):
+        """
+        Generates a DMA handler with the active callback and buffer size baked
+        in (no callback branches or attribute loads per buffer) and installs it
+        as _dma_handler. Behaviour matches _process_audio_dma_generic.
+        """
+        n = self.buffer_size
+        if self._c_callback is not None:
+            # Raw-pointer dispatch: the layout check must survive -O
+            check = f"if not is_dma_layout(in_data, ({n},)): raise ValueError(IN_DATA_ERROR)"
+            dispatch = f"c_callback(in_data.ctypes.data, out_ptrs[idx], {n})"
+        else:
+            check = f"assert is_dma_layout(in_data, ({n},)), IN_DATA_ERROR"
+            if self.audio_dma_callback is not None:
+                dispatch = "callback(in_data, out_buffer)"
+            else:
+                dispatch = "copyto(out_buffer, in_data)"
+        name = f"_process_audio_dma_{n}"
+        src = (f"def {name}(self, in_data):\n"
+               f"    {check}\n"
+               "    count = self.processed_buffers + 1\n"
+               "    self.processed_buffers = count\n"
+               "    idx = count & 1\n"
+               "    out_buffer = dma_buffers[idx]\n"
+               f"    {dispatch}\n"
+               "    return out_buffer\n")
+        namespace = {
+            'dma_buffers': tuple(self.dma_buffers),
+            'out_ptrs': tuple(self._dma_buffer_ptrs),
+            'c_callback': self._c_callback,
+            'callback': self.audio_dma_callback,
+            'copyto': np.copyto,
+            'is_dma_layout': _is_dma_layout,
+            'IN_DATA_ERROR': IN_DATA_ERROR,
+        }
+        exec(src, namespace)
+        self._dma_handler = types.MethodType(namespace[name], self)
 
     def process_audio_dma(self, in_data):
         """
         Simulates DMA-triggered audio processing with double buffering.
-        Half-buffer complete interrupt simulation.
+        Half-buffer complete interrupt simulation. Returns the output half-buffer
+        the callback wrote into; it stays valid until the next-but-one call.
+        in_data must be a C-contiguous DMA_DTYPE ndarray of buffer_size samples,
+        so nothing is converted or copied on the way in; wrap raw memory once
+        with np.frombuffer. Checked only in __debug__ builds.
+        Dispatches to the handler installed for the current run (see _specialize_dma).
         """
-        self.dma_buffer_idx = (self.dma_buffer_idx + 1) % 2
-        self.processed_buffers += 1
+        return self._dma_handler(in_data)
+
+    def _process_audio_dma_generic(self, in_data):
+        """Unspecialized DMA handler, used while stopped."""
+        shape = (self.buffer_size,)
+        assert _is_dma_layout(in_data, shape), IN_DATA_ERROR
+        count = self.processed_buffers + 1
+        self.processed_buffers = count
+        idx = count & 1
+        out_buffer = self.dma_buffers[idx]
         
-        if self.audio_dma_callback:
-            return self.audio_dma_callback(in_data)
-        return in_data
+        c_callback = self._c_callback
+        if c_callback is not None:
+            # Straight into native code with the GIL released; it reads
+            # buffer_size samples through a raw pointer, so check even under -O
+            if not _is_dma_layout(in_data, shape):
+                raise ValueError(IN_DATA_ERROR)
+            c_callback(in_data.ctypes.data, self._dma_buffer_ptrs[idx], self.buffer_size)
+            return out_buffer
+        
+        callback = self.audio_dma_callback
+        if callback is not None:
+            callback(in_data, out_buffer)
+        else:
+            np.copyto(out_buffer, in_data)
+        return out_buffer
+
+    def process_audio_dma_batch(self, in_batch, out_batch=None):
+        """
+        Processes N half-buffers, in_batch of shape (N, buffer_size), with a single
+        callback invocation: the callback sees the whole 2D block and must work on
+        it in place (e.g. np.right_shift(in_batch, 1, out=out_batch)). Counters
+        advance by N. Output goes to out_batch, or to an internal buffer that is
+        reused (and only grown) across calls.
+        """
+        n = in_batch.shape[0]
+        shape = (n, self.buffer_size)
+        assert _is_dma_layout(in_batch, shape), IN_DATA_ERROR
+        count = self.processed_buffers + n
+        self.processed_buffers = count
+        
+        if out_batch is None:
+            if self._batch_out.shape[0] < n:
+                self._batch_out = np.empty((n, self.buffer_size), dtype=DMA_DTYPE)
+            out_batch = self._batch_out[:n]
+        assert _is_dma_layout(out_batch, shape), OUT_BATCH_ERROR
+        
+        c_callback = self._c_callback
+        if c_callback is not None:
+            # Native code reads/writes through raw pointers, so this check must
+            # survive -O: a mismatched block means out-of-bounds access
+            if not (_is_dma_layout(in_batch, shape) and _is_dma_layout(out_batch, shape)):
+                raise ValueError(OUT_BATCH_ERROR)
+            # Contiguous blocks, so the compiled callback sees one long buffer
+            c_callback(in_batch.ctypes.data, out_batch.ctypes.data, in_batch.size)
+            return out_batch
+        
+        callback = self.audio_dma_callback
+        if callback is not None:
+            callback(in_batch, out_batch)
+        else:
+            np.copyto(out_batch, in_batch)
+        return out_batch
 
 if __name__ == "__main__":
+    import queue
+    import logging.handlers
+    
+    # Log through a queue so the 100Hz callback never blocks on stdout; the
+    # listener thread does the actual writes at normal priority
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+    logging.getLogger().addHandler(logging.handlers.QueueHandler(log_queue))
+    logging.getLogger().setLevel(logging.INFO)
+    listener.start()
+    
     # Test stub
     def mock_timer():
-        print(f"Timer IRQ at {time.time():.4f}")
+        if __debug__:
+            logger.info("Timer IRQ at %.4f", time.time())
 
-    def mock_audio(data):
-        return data * 0.5  # Simple gain reduction
+    def mock_audio(data, out_buffer):
+        np.right_shift(data, 1, out=out_buffer)  # -6dB gain as an arithmetic shift
 
     controller = STM32_Controller()
     controller.start(mock_timer, mock_audio)
     
     try:
-        time.sleep(0.1)  # Run for a bit
+        # Feed half-buffer completions at the real DMA rate for a bit
+        block = np.zeros(controller.buffer_size, dtype=DMA_DTYPE)
+        out_block = np.empty_like(block)
+        received = 0
+        for _ in range(10):
+            controller.push_audio_dma(block)
+            time.sleep(controller.buffer_size / controller.sample_rate)
+            while controller.pop_audio_dma(out_block):
+                received += 1
     finally:
         controller.stop()
+        listener.stop()
+    while controller.pop_audio_dma(out_block):
+        received += 1
+    print(f"Processed {controller.processed_buffers} DMA buffers ({received} returned), "
+          f"{controller.dma_overruns} overruns")